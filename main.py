@@ -4,42 +4,64 @@ Single file implementation supporting 4000+ concurrent users
 """
 
 import asyncio
+import atexit
 import sqlite3
-import json
 import random
 import datetime
 import threading
 import time
 import os
 import logging
-from typing import Dict, List, Optional, Tuple
+import logging.handlers
+import queue
+import csv
+from typing import List, Optional
 import re
 
 # External libraries for bot functionality
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, CallbackContext, filters
-
-# Libraries for file generation
-import openpyxl
-from telegram.ext import CallbackContext
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from io import BytesIO
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from telegram.error import RetryAfter, TelegramError, Unauthorized
+from telegram.ext import Updater, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, CallbackContext, Filters, Defaults
+from apscheduler.jobstores.base import JobLookupError
+
+# Libraries for file generation (openpyxl/reportlab are imported lazily inside the report builders)
+from io import BytesIO, TextIOWrapper
+
+# Configure logging: handlers only enqueue records, a listener thread formats and writes them
+log_queue = queue.Queue(-1)
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_queue_handler = logging.handlers.QueueHandler(log_queue)
+log_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Listener applies the real format
+logging.getLogger().addHandler(log_queue_handler)
+logging.getLogger().setLevel(logging.INFO)
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Drain queued records (shutdown/crash messages) on exit
 logger = logging.getLogger(__name__)
 
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 ADMIN_IDS = [6578706277, 7853664401]  # Admin user IDs
+ADMIN_ID_SET = frozenset(ADMIN_IDS)  # O(1) permission checks
+
+# Telegram API connection settings
+UPDATER_WORKERS = 8  # dispatcher worker threads
+CONNECTION_POOL_SIZE = 32  # keep-alive connections to api.telegram.org shared by all threads
+
+# Report builds allowed at once; further exports wait for a free slot
+REPORT_BUILD_SLOTS = 2
+
+# Admin views may show the user list up to this many seconds old
+ALL_USERS_CACHE_TTL = 30
+
+# Per-user lookups are cached for this long, for at most this many users
+USER_CACHE_TTL = 600
+USER_CACHE_MAX_SIZE = 10000
+
+# Webhook configuration (long polling is used when WEBHOOK_URL is not set)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
 
 # Conversation states
 (NAME, SURNAME, PHONE, AGE, REGION, DISTRICT, NEIGHBORHOOD, 
@@ -52,6 +74,13 @@ AGE_GROUPS = {
     "11-14": ["Kitob 1", "Kitob 2", "Kitob 3", "Kitob 4"]
 }
 
+# Age group button labels, in keyboard order, and the label -> age group lookup used to parse them
+AGE_GROUP_LABELS = tuple(f"{age_group} yosh" for age_group in AGE_GROUPS)
+AGE_GROUP_BY_LABEL = {f"{age_group} yosh": age_group for age_group in AGE_GROUPS}
+
+# Books per age group as sets for O(1) selection checks
+AGE_GROUP_BOOKS = {age_group: frozenset(books) for age_group, books in AGE_GROUPS.items()}
+
 # Regions and districts
 LOCATIONS = {
     "Toshkent": ["Bektemir", "Chilonzor", "Mirzo Ulug'bek", "Mirobod", "Olmazor", "Sergeli", "Shayxontohur", "Uchtepa", "Yakkasaray", "Yunusobod"],
@@ -68,23 +97,173 @@ LOCATIONS = {
     "Xorazm": ["Urganch", "Bog'ot", "Gurlan", "Qo'shko'pir", "Shovot", "Xonqa", "Xiva", "Yangiariq", "Yangiqo'rg'on"]
 }
 
+# Freeze district lists (dropping repeated names, keeping order) and index them for O(1) validation
+LOCATIONS = {region: tuple(dict.fromkeys(districts)) for region, districts in LOCATIONS.items()}
+VALID_DISTRICTS = {region: frozenset(districts) for region, districts in LOCATIONS.items()}
+
+# Input validators (compiled once at import)
+NAME_RE = re.compile("^[a-zA-ZА-Яа-я\u0400-\u04FF ]+$")
+PHONE_RE = re.compile(r"^\+998\d{9}$")
+ANSWER_CALLBACK_RE = re.compile(r"^answer_([ABCD])_(\d+)$")
+
+# Prebuilt keyboards (static, shared by all handlers)
+MAIN_MENU_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        ["📝 Test topshirish", "📋 Loyiha haqida"],
+        ["💬 Fikr bildirish", "📊 Natijalarim"]
+    ],
+    resize_keyboard=True, one_time_keyboard=False
+)
+ADMIN_MENU_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        ["👥 Foydalanuvchilar", "📊 Test natijalari"],
+        ["➕ Savol qo'shish", "📥 Eksport"],
+        ["📈 Statistika", "🔄 Yangilash"]
+    ],
+    resize_keyboard=True
+)
+EXPORT_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        ["📊 Excel - Foydalanuvchilar", "📊 Excel - Natijalar"],
+        ["📄 PDF - Foydalanuvchilar", "📄 PDF - Natijalar"],
+        ["📑 CSV - Foydalanuvchilar", "📑 CSV - Natijalar"],
+        ["🔙 Orqaga"]
+    ],
+    one_time_keyboard=True, resize_keyboard=True
+)
+AGE_KEYBOARD = ReplyKeyboardMarkup([[label] for label in AGE_GROUP_LABELS], one_time_keyboard=True, resize_keyboard=True)
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
+REGION_KEYBOARD = ReplyKeyboardMarkup([[region] for region in LOCATIONS], one_time_keyboard=True, resize_keyboard=True)
+BOOK_KEYBOARDS = {
+    age_group: ReplyKeyboardMarkup([[book] for book in books], one_time_keyboard=True, resize_keyboard=True)
+    for age_group, books in AGE_GROUPS.items()
+}
+DISTRICT_KEYBOARDS = {
+    region: ReplyKeyboardMarkup([[district] for district in districts], one_time_keyboard=True, resize_keyboard=True)
+    for region, districts in LOCATIONS.items()
+}
+
+# Static texts
+WELCOME_TEXT = (
+    "🌟 Assalomu alaykum! Kitobxon Kids botiga xush kelibsiz!\n\n"
+    "📝 Ro'yxatdan o'tish uchun ma'lumotlaringizni kiriting.\n\n"
+    "👤 Ismingizni kiriting:"
+)
+WELCOME_BACK_TEMPLATE = "Assalomu alaykum, {name}! Siz allaqachon ro'yxatdan o'tgansiz."
+ADMIN_WELCOME_TEXT = "Assalomu alaykum, Admin! Admin paneliga xush kelibsiz."
+FEEDBACK_PROMPT_TEXT = (
+    "💭 Fikr-mulohazangizni yozing:\n\n"
+    "Bizga loyihamizni yaxshilashda yordam bering!"
+)
+TEST_START_TEMPLATE = (
+    "🚀 {heading}\n\n"
+    "📚 Kitob: {book_name}\n"
+    "👥 Yosh guruhi: {age_group}\n"
+    "❓ Jami savollar: 25 ta\n"
+    "⏱ Har bir savol uchun: 20 soniya\n"
+    "🎯 Har bir to'g'ri javob: 4 ball\n\n"
+    "🍀 Omad tilaymiz!"
+)
+
+ABOUT_TEXT = (
+    "📖 Kitobxon Kids loyihasi haqida\n\n"
+    "🎯 Maqsad: Bolalarning bilim darajasini baholash va o'qishga rag'batlantirishni ta'minlash\n\n"
+    "👥 Maqsadli auditoriya: 7-14 yosh oralig'idagi bolalar\n\n"
+    "📚 Test tizimi:\n"
+    "• 7-10 yosh guruhi uchun 4 ta kitob\n"
+    "• 11-14 yosh guruhi uchun 4 ta kitob\n"
+    "• Har bir kitobda 25 ta savol\n"
+    "• Har bir savol uchun 20 soniya vaqt\n"
+    "• To'g'ri javob uchun 4 ball\n\n"
+    "🏆 Natijalar:\n"
+    "• 80% va undan yuqori - A'lo\n"
+    "• 60-79% - Yaxshi\n"
+    "• 60% dan past - Qo'shimcha o'qish tavsiya etiladi\n\n"
+    "📞 Aloqa: @kitobxon_kids_support"
+)
+
+# Test result templates
+TEST_RESULT_TEMPLATE = (
+    "🎉 Test yakunlandi!\n\n"
+    "👤 Ism: {user_name}\n"
+    "📚 Kitob: {book_name}\n"
+    "👥 Yosh guruhi: {age_group}\n"
+    "🎯 Ball: {score}/{max_score}\n"
+    "📊 Foiz: {percentage:.1f}%\n"
+    "✅ Javob berilgan savollar: {questions_answered}/{total_questions}\n"
+    "⏱ Vaqt: {start:%H:%M} - {end:%H:%M}\n\n"
+    "{verdict}"
+)
+TEST_RESULT_VERDICTS = (
+    (80, "🏆 Ajoyib natija! Tabriklaymiz!"),
+    (60, "👍 Yaxshi natija! Davom eting!"),
+    (0, "📚 Qo'shimcha o'qish tavsiya etiladi.")
+)
+
+# Admin notification templates
+REGISTRATION_ADMIN_TEMPLATE = (
+    "📋 Yangi foydalanuvchi ro'yxatdan o'tdi:\n\n"
+    "👤 Ism: {name}\n"
+    "👨‍👩‍👧‍👦 Familiya: {surname}\n"
+    "📱 Telefon: {phone}\n"
+    "🎂 Yosh: {age_group}\n"
+    "🌍 Viloyat: {region}\n"
+    "🏘 Tuman: {district}\n"
+    "🏠 Mahalla: {neighborhood}\n"
+    "🕒 Vaqt: {time}"
+)
+TEST_RESULT_ADMIN_TEMPLATE = (
+    "📊 Yangi test natijasi:\n\n"
+    "👤 Foydalanuvchi: {user_name}\n"
+    "📱 Telefon: {phone}\n"
+    "{address}"
+    "📚 Kitob: {book_name}\n"
+    "👥 Yosh: {age_group}\n"
+    "🎯 Ball: {score}/{max_score}\n"
+    "📊 Foiz: {percentage:.1f}%\n"
+    "✅ Javoblar: {questions_answered}/{total_questions}\n"
+    "🕒 Vaqt: {time}"
+)
+
 # Global state management
 user_states = {}
 active_tests = {}
 question_timers = {}
 
+# Test jobs must run even if they wait for a free job-queue thread; APScheduler's
+# default 1 s misfire grace would silently skip them and strand the test session
+TEST_JOB_KWARGS = {'misfire_grace_time': None}
+
 class DatabaseManager:
     """Database management class for SQLite operations"""
     
     def __init__(self, db_name="kitobxon_kids.db"):
         self.db_name = db_name
+        self._local = threading.local()
+        self._user_cache = {}  # chat_id -> (loaded_at, user), kept coherent by register_user
+        self._user_cache_lock = threading.Lock()
+        self._all_users_cache = None  # (loaded_at, users) for admin views, dropped by register_user
+        self._question_pools = {}  # (age_group, book_name) -> every question for that book
         self.init_database()
     
+    def get_connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name)
+            # WAL commits append to the log; fsync only at checkpoints
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
     def init_database(self):
         """Initialize database with required tables"""
         conn = sqlite3.connect(self.db_name)
         cursor = conn.cursor()
         
+        # Write-ahead logging: writers append instead of rewriting pages, readers don't block
+        cursor.execute("PRAGMA journal_mode=WAL")
+        
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -138,6 +317,12 @@ class DatabaseManager:
             )
         ''')
         
+        # Per-user results lookup ("Natijalarim") without scanning every result
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_test_results_user
+            ON test_results (user_id, test_date)
+        ''')
+        
         # Feedback table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS feedback (
@@ -330,19 +515,34 @@ class DatabaseManager:
             ("7-10", "Kitob 2", "Kalamushlar xo'roz eshak va ho'kizdan nima suraydi?", "Ovqat", "Suv", "Boshpana", "Yordam", "A")
         ]
         
-        for question in sample_questions:
-            cursor.execute('''
-                INSERT OR IGNORE INTO questions 
+        # Older versions re-seeded on every start; drop those duplicates (keeping the
+        # first copy) and enforce uniqueness so a test never repeats a question
+        cursor.execute('''
+            DELETE FROM questions WHERE question_id NOT IN (
+                SELECT MIN(question_id) FROM questions
+                GROUP BY age_group, book_name, question_text
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_unique
+            ON questions (age_group, book_name, question_text)
+        ''')
+        
+        # Seed once in a single batch
+        cursor.execute("SELECT COUNT(*) FROM questions")
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany('''
+                INSERT INTO questions 
                 (age_group, book_name, question_text, option_a, option_b, option_c, option_d, correct_answer, created_by)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', question + (ADMIN_IDS[0],))
+            ''', [question + (ADMIN_IDS[0],) for question in sample_questions])
         
         conn.commit()
         conn.close()
     
     def execute_query(self, query: str, params: tuple = None):
         """Execute a query and return results"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
@@ -363,27 +563,38 @@ class DatabaseManager:
             conn.rollback()
             return []
         finally:
-            conn.close()
+            cursor.close()
     
     def register_user(self, chat_id: int, name: str, surname: str, phone: str, 
                      age_group: str, region: str, district: str, neighborhood: str) -> bool:
         """Register a new user"""
         query = '''
-            INSERT OR REPLACE INTO users 
+            INSERT INTO users 
             (chat_id, name, surname, phone, age_group, region, district, neighborhood)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                name = excluded.name, surname = excluded.surname, phone = excluded.phone,
+                age_group = excluded.age_group, region = excluded.region,
+                district = excluded.district, neighborhood = excluded.neighborhood
         '''
         result = self.execute_query(query, (chat_id, name, surname, phone, age_group, region, district, neighborhood))
+        with self._user_cache_lock:
+            self._user_cache.pop(chat_id, None)
+        self._all_users_cache = None
         return isinstance(result, int) and result > 0
     
     def get_user(self, chat_id: int) -> Optional[dict]:
-        """Get user information"""
+        """Get user information (served from memory for USER_CACHE_TTL seconds)"""
+        cached = self._user_cache.get(chat_id)
+        if cached is not None and time.monotonic() - cached[0] < USER_CACHE_TTL:
+            return cached[1]
+        
         query = "SELECT * FROM users WHERE chat_id = ?"
         result = self.execute_query(query, (chat_id,))
         
         if result and len(result) > 0:
             user_data = result[0]
-            return {
+            user = {
                 'user_id': user_data[0],
                 'chat_id': user_data[1],
                 'name': user_data[2],
@@ -396,18 +607,30 @@ class DatabaseManager:
                 'registration_date': user_data[9],
                 'is_active': user_data[10]
             }
+            with self._user_cache_lock:
+                # Evict the oldest entry once full (dicts keep insertion order)
+                if len(self._user_cache) >= USER_CACHE_MAX_SIZE and chat_id not in self._user_cache:
+                    self._user_cache.pop(next(iter(self._user_cache)))
+                self._user_cache.pop(chat_id, None)
+                self._user_cache[chat_id] = (time.monotonic(), user)
+            return user
         return None
     
     def get_questions(self, age_group: str, book_name: str, limit: int = 25) -> List[dict]:
-        """Get randomized questions for a test"""
+        """Get randomized questions for a test (sampled from the book's cached question pool)"""
+        pool = self._question_pools.get((age_group, book_name))
+        if pool is None:
+            pool = self._load_question_pool(age_group, book_name)
+        return random.sample(pool, min(limit, len(pool)))
+    
+    def _load_question_pool(self, age_group: str, book_name: str) -> List[dict]:
+        """Load every question of a book once; the question bank doesn't change at runtime"""
         query = '''
             SELECT question_id, question_text, option_a, option_b, option_c, option_d, correct_answer
             FROM questions 
             WHERE age_group = ? AND book_name = ?
-            ORDER BY RANDOM()
-            LIMIT ?
         '''
-        results = self.execute_query(query, (age_group, book_name, limit))
+        results = self.execute_query(query, (age_group, book_name))
         
         questions = []
         for result in results:
@@ -418,9 +641,11 @@ class DatabaseManager:
                 'option_b': result[3],
                 'option_c': result[4],
                 'option_d': result[5],
-                'correct_answer': result[6]
+                'correct_answer': result[6].upper()
             })
         
+        if questions:  # an empty result may be a transient error, so it is not cached
+            self._question_pools[(age_group, book_name)] = questions
         return questions
     
     def save_test_result(self, user_id: int, age_group: str, book_name: str,
@@ -445,7 +670,11 @@ class DatabaseManager:
         return isinstance(result, int) and result > 0
     
     def get_all_users(self) -> List[dict]:
-        """Get all registered users"""
+        """Get all registered users (cached for ALL_USERS_CACHE_TTL seconds)"""
+        cached = self._all_users_cache
+        if cached is not None and time.monotonic() - cached[0] < ALL_USERS_CACHE_TTL:
+            return cached[1]
+        
         query = "SELECT * FROM users ORDER BY registration_date DESC"
         results = self.execute_query(query)
         
@@ -465,10 +694,11 @@ class DatabaseManager:
                 'is_active': result[10]
             })
         
+        self._all_users_cache = (time.monotonic(), users)
         return users
     
-    def get_test_results(self) -> List[dict]:
-        """Get all test results with user information"""
+    def get_test_results(self, limit: Optional[int] = None) -> List[dict]:
+        """Get test results with user information, newest first"""
         query = '''
             SELECT u.name, u.surname, u.age_group, tr.book_name, tr.score, 
                    tr.total_questions, tr.percentage, tr.test_date
@@ -476,7 +706,10 @@ class DatabaseManager:
             JOIN users u ON tr.user_id = u.chat_id
             ORDER BY tr.test_date DESC
         '''
-        results = self.execute_query(query)
+        if limit is not None:
+            results = self.execute_query(query + " LIMIT ?", (limit,))
+        else:
+            results = self.execute_query(query)
         
         test_results = []
         for result in results:
@@ -492,6 +725,39 @@ class DatabaseManager:
             })
         
         return test_results
+    
+    def count_test_results(self) -> int:
+        """Count test results that belong to registered users"""
+        query = "SELECT COUNT(*) FROM test_results tr JOIN users u ON tr.user_id = u.chat_id"
+        result = self.execute_query(query)
+        return result[0][0] if result else 0
+
+    def get_statistics(self, today: str) -> dict:
+        """Aggregate admin statistics in SQL instead of loading every row"""
+        user_stats = self.execute_query('''
+            SELECT COUNT(*),
+                   COALESCE(SUM(age_group = '7-10'), 0),
+                   COALESCE(SUM(age_group = '11-14'), 0),
+                   COALESCE(SUM(substr(registration_date, 1, 10) = ?), 0)
+            FROM users
+        ''', (today,))
+        result_stats = self.execute_query('''
+            SELECT COUNT(*), COALESCE(AVG(tr.percentage), 0)
+            FROM test_results tr
+            JOIN users u ON tr.user_id = u.chat_id
+        ''')
+        
+        total_users, age_7_10, age_11_14, today_users = user_stats[0] if user_stats else (0, 0, 0, 0)
+        total_tests, avg_score = result_stats[0] if result_stats else (0, 0)
+        
+        return {
+            'total_users': total_users,
+            'total_tests': total_tests,
+            'age_7_10': age_7_10,
+            'age_11_14': age_11_14,
+            'today_users': today_users,
+            'avg_score': avg_score
+        }
 
 # Initialize database
 db = DatabaseManager()
@@ -506,10 +772,28 @@ class TestManager:
         if len(questions) < 5:  # Minimum 5 questions needed for a test
             return False
         
+        # Answer keyboards and question texts are built once per test, not on every question
+        keyboards = [
+            InlineKeyboardMarkup([
+                [InlineKeyboardButton(f"{option}) {question['option_' + option.lower()]}", callback_data=f"answer_{option}_{chat_id}")]
+                for option in ("A", "B", "C", "D")
+            ])
+            for question in questions
+        ]
+        total_questions = len(questions)
+        texts = [
+            f"📝 Savol {number}/{total_questions}\n\n"
+            f"❓ {question['question_text']}\n\n"
+            "⏱ Sizda 20 soniya vaqt bor!"
+            for number, question in enumerate(questions, 1)
+        ]
+        
         active_tests[chat_id] = {
             'age_group': age_group,
             'book_name': book_name,
             'questions': questions,
+            'keyboards': keyboards,
+            'texts': texts,
             'current_question': 0,
             'score': 0,
             'start_time': datetime.datetime.now().isoformat(),
@@ -520,10 +804,10 @@ class TestManager:
     
     def get_current_question(self, chat_id: int) -> Optional[dict]:
         """Get the current question for a user"""
-        if chat_id not in active_tests:
+        test = active_tests.get(chat_id)
+        if test is None:
             return None
         
-        test = active_tests[chat_id]
         if test['current_question'] >= len(test['questions']):
             return None
         
@@ -531,14 +815,14 @@ class TestManager:
     
     def submit_answer(self, chat_id: int, answer: str) -> bool:
         """Submit an answer and move to next question"""
-        if chat_id not in active_tests:
+        test = active_tests.get(chat_id)
+        if test is None:
             return False
         
-        test = active_tests[chat_id]
         current_q = test['questions'][test['current_question']]
         
         # Check if answer is correct
-        is_correct = (answer.upper() == current_q['correct_answer'].upper())
+        is_correct = (answer.upper() == current_q['correct_answer'])
         if is_correct:
             test['score'] += 4
         
@@ -554,10 +838,10 @@ class TestManager:
     
     def timeout_question(self, chat_id: int) -> bool:
         """Handle question timeout"""
-        if chat_id not in active_tests:
+        test = active_tests.get(chat_id)
+        if test is None:
             return False
         
-        test = active_tests[chat_id]
         current_q = test['questions'][test['current_question']]
         
         test['answers'].append({
@@ -572,18 +856,18 @@ class TestManager:
     
     def is_test_complete(self, chat_id: int) -> bool:
         """Check if test is complete"""
-        if chat_id not in active_tests:
+        test = active_tests.get(chat_id)
+        if test is None:
             return True
         
-        test = active_tests[chat_id]
         return test['current_question'] >= len(test['questions'])
     
     def get_test_results(self, chat_id: int) -> Optional[dict]:
         """Get test results"""
-        if chat_id not in active_tests:
+        test = active_tests.get(chat_id)
+        if test is None:
             return None
         
-        test = active_tests[chat_id]
         
         results = {
             'age_group': test['age_group'],
@@ -598,87 +882,98 @@ class TestManager:
         
         return results
     
+    def cancel_timeout(self, chat_id: int):
+        """Cancel the pending answer timeout job, if any"""
+        timeout_job = question_timers.pop(chat_id, None)
+        if timeout_job is not None:
+            try:
+                timeout_job.schedule_removal()
+            except JobLookupError:
+                pass  # Job already fired (e.g. cleanup from inside the timeout itself)
+    
     def cleanup_test(self, chat_id: int):
         """Clean up test session"""
-        if chat_id in active_tests:
-            del active_tests[chat_id]
-        if chat_id in question_timers:
-            del question_timers[chat_id]
+        active_tests.pop(chat_id, None)
+        self.cancel_timeout(chat_id)
 
 test_manager = TestManager()
 
-def create_excel_report(data, report_type="users"):
-    """Create Excel report"""
-    wb = openpyxl.Workbook()
-    ws = wb.active
+def get_report_table(data, report_type="users"):
+    """Return (title, [(header, width)], rows) for a report; rows is a lazy generator"""
+    title, columns, rows = "Hisobot", [], ()
     
     if report_type == "users":
-        ws.title = "Foydalanuvchilar"
-        
-        # Headers
-        headers = ["Ism", "Familiya", "Telefon", "Yosh guruhi", "Viloyat", "Tuman", "Mahalla", "Ro'yxatdan o'tgan sana"]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Data
-        for row, user in enumerate(data, 2):
-            ws.cell(row=row, column=1, value=user.get('name', ''))
-            ws.cell(row=row, column=2, value=user.get('surname', ''))
-            ws.cell(row=row, column=3, value=user.get('phone', ''))
-            ws.cell(row=row, column=4, value=user.get('age_group', ''))
-            ws.cell(row=row, column=5, value=user.get('region', ''))
-            ws.cell(row=row, column=6, value=user.get('district', ''))
-            ws.cell(row=row, column=7, value=user.get('neighborhood', ''))
-            ws.cell(row=row, column=8, value=user.get('registration_date', ''))
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        title = "Foydalanuvchilar"
+        columns = [
+            ("Ism", 18), ("Familiya", 20), ("Telefon", 16), ("Yosh guruhi", 12),
+            ("Viloyat", 16), ("Tuman", 18), ("Mahalla", 24), ("Ro'yxatdan o'tgan sana", 22)
+        ]
+        rows = (
+            [
+                user.get('name', ''),
+                user.get('surname', ''),
+                user.get('phone', ''),
+                user.get('age_group', ''),
+                user.get('region', ''),
+                user.get('district', ''),
+                user.get('neighborhood', ''),
+                user.get('registration_date', '')
+            ]
+            for user in data
+        )
     
     elif report_type == "results":
-        ws.title = "Test natijalari"
-        
-        # Headers
-        headers = ["Ism", "Familiya", "Yosh guruhi", "Kitob", "Ball", "Jami savollar", "Foiz", "Test sanasi"]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Data
-        for row, result in enumerate(data, 2):
-            ws.cell(row=row, column=1, value=result.get('name', ''))
-            ws.cell(row=row, column=2, value=result.get('surname', ''))
-            ws.cell(row=row, column=3, value=result.get('age_group', ''))
-            ws.cell(row=row, column=4, value=result.get('book_name', ''))
-            ws.cell(row=row, column=5, value=result.get('score', 0))
-            ws.cell(row=row, column=6, value=result.get('total_questions', 0))
-            ws.cell(row=row, column=7, value=f"{result.get('percentage', 0):.1f}%")
-            ws.cell(row=row, column=8, value=result.get('test_date', ''))
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+        title = "Test natijalari"
+        columns = [
+            ("Ism", 18), ("Familiya", 20), ("Yosh guruhi", 12), ("Kitob", 14),
+            ("Ball", 8), ("Jami savollar", 14), ("Foiz", 10), ("Test sanasi", 22)
+        ]
+        rows = (
+            [
+                result.get('name', ''),
+                result.get('surname', ''),
+                result.get('age_group', ''),
+                result.get('book_name', ''),
+                result.get('score', 0),
+                result.get('total_questions', 0),
+                f"{result.get('percentage', 0):.1f}%",
+                result.get('test_date', '')
+            ]
+            for result in data
+        )
+    
+    return title, columns, rows
+
+def create_excel_report(data, report_type="users"):
+    """Create Excel report (rows are streamed with openpyxl's write-only mode)"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment
+    from openpyxl.utils import get_column_letter
+    
+    title, columns, rows = get_report_table(data, report_type)
+    
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    
+    # Fixed column widths, set before the first row as write-only mode requires
+    for col, (_, width) in enumerate(columns, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+    
+    # Headers (one shared font/alignment pair for every header cell)
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal="center")
+    header_cells = []
+    for header, _ in columns:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_cells.append(cell)
+    ws.append(header_cells)
+    
+    # Data
+    for row in rows:
+        ws.append(row)
     
     # Save to BytesIO
     buffer = BytesIO()
@@ -686,60 +981,110 @@ def create_excel_report(data, report_type="users"):
     buffer.seek(0)
     return buffer
 
+def create_csv_report(data, report_type="users"):
+    """Create CSV report (UTF-8 with BOM so Excel shows Uzbek letters correctly)"""
+    _, columns, rows = get_report_table(data, report_type)
+    
+    buffer = BytesIO()
+    text = TextIOWrapper(buffer, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow([header for header, _ in columns])
+    writer.writerows(rows)
+    text.detach()  # flush into buffer without closing it
+    
+    buffer.seek(0)
+    return buffer
+
+# reportlab styles, built on the first PDF export and shared by every later one
+_pdf_styles = {}
+
+def get_pdf_styles() -> dict:
+    """Return the shared PDF title and table styles, building them on first use"""
+    if not _pdf_styles:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import TableStyle
+        
+        sample_styles = getSampleStyleSheet()
+        _pdf_styles.update({
+            'title': sample_styles['Title'],
+            'body': sample_styles['BodyText'],
+            'table': TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 14),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ])
+        })
+    return _pdf_styles
+
 def create_pdf_report(data, report_type="users"):
-    """Create PDF report"""
+    """Create PDF report (only a summary page above PDF_MAX_TABLE_ROWS rows)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, LongTable, Paragraph, Spacer
+    
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
-    styles = getSampleStyleSheet()
+    styles = get_pdf_styles()
+    
+    # Very large reports: a one-page summary, the full table is sent as CSV alongside
+    if len(data) > PDF_MAX_TABLE_ROWS:
+        title = "Foydalanuvchilar ro'yxati" if report_type == "users" else "Test natijalari"
+        elements.append(Paragraph(title, styles['title']))
+        elements.append(Spacer(1, 12))
+        elements.append(Paragraph(f"Jami: {len(data)} ta yozuv. To'liq jadval CSV faylda yuborildi.", styles['body']))
+        doc.build(elements)
+        
+        buffer.seek(0)
+        return buffer
     
     # Title
     if report_type == "users":
-        title = Paragraph("Foydalanuvchilar ro'yxati", styles['Title'])
+        title = Paragraph("Foydalanuvchilar ro'yxati", styles['title'])
         elements.append(title)
         elements.append(Spacer(1, 12))
         
         # Table data
         table_data = [["Ism", "Familiya", "Telefon", "Yosh", "Viloyat", "Tuman"]]
-        for user in data:
-            table_data.append([
+        table_data.extend(
+            [
                 user.get('name', ''),
                 user.get('surname', ''),
                 user.get('phone', ''),
                 user.get('age_group', ''),
                 user.get('region', ''),
                 user.get('district', '')
-            ])
+            ]
+            for user in data
+        )
     
     elif report_type == "results":
-        title = Paragraph("Test natijalari", styles['Title'])
+        title = Paragraph("Test natijalari", styles['title'])
         elements.append(title)
         elements.append(Spacer(1, 12))
         
         # Table data
         table_data = [["Ism", "Familiya", "Yosh", "Kitob", "Ball", "Foiz"]]
-        for result in data:
-            table_data.append([
+        table_data.extend(
+            [
                 result.get('name', ''),
                 result.get('surname', ''),
                 result.get('age_group', ''),
                 result.get('book_name', ''),
                 str(result.get('score', 0)),
                 f"{result.get('percentage', 0):.1f}%"
-            ])
+            ]
+            for result in data
+        )
     
-    # Create table
-    table = Table(table_data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    # Create table (LongTable lays out long multi-page tables faster; header repeats on each page)
+    table = LongTable(table_data, repeatRows=1)
+    table.setStyle(styles['table'])
     
     elements.append(table)
     doc.build(elements)
@@ -747,6 +1092,74 @@ def create_pdf_report(data, report_type="users"):
     buffer.seek(0)
     return buffer
 
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # set by pause(); no tokens are handed out before it
+        self.lock = threading.Lock()
+    
+    def pause(self, seconds: float):
+        """Stop handing out tokens to every caller for the given number of seconds"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # Start refilling from empty when the pause ends instead of bursting a full bucket
+            self.tokens = 0.0
+            self.updated = self.blocked_until
+    
+    def acquire(self):
+        """Block until a token is available and take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Admin notification queue (drained by a pool of background worker threads)
+ADMIN_NOTIFY_QUEUE = queue.Queue()
+ADMIN_NOTIFY_RATE = 25  # messages per second, below Telegram's 30 msg/s limit
+ADMIN_NOTIFY_WORKERS = 4  # sends in flight at once; the shared limiter caps the total rate
+admin_notify_limiter = TokenBucket(ADMIN_NOTIFY_RATE, ADMIN_NOTIFY_RATE)
+
+def notify_admins(text: str):
+    """Queue a notification for every admin without blocking the handler"""
+    for admin_id in ADMIN_IDS:
+        ADMIN_NOTIFY_QUEUE.put((admin_id, text))
+
+def admin_notification_worker(bot):
+    """Send queued admin notifications, respecting the rate limit"""
+    while True:
+        admin_id, text = ADMIN_NOTIFY_QUEUE.get()
+        admin_notify_limiter.acquire()
+        try:
+            bot.send_message(admin_id, text)
+        except RetryAfter as e:
+            # Flood control: pause the shared limiter so every worker waits as long as
+            # Telegram asks, then send it again
+            admin_notify_limiter.pause(e.retry_after)
+            ADMIN_NOTIFY_QUEUE.put((admin_id, text))
+        except Unauthorized:
+            # The admin blocked the bot or never started it; expected, nothing to retry
+            pass
+        except TelegramError as e:
+            logger.warning(f"Admin notification error: {e}")
+        except Exception:
+            logger.exception("Unexpected admin notification error")
+        finally:
+            ADMIN_NOTIFY_QUEUE.task_done()
+
 # Bot command handlers
 
 async def timeout_handler(context: CallbackContext, chat_id: int):
@@ -777,42 +1190,32 @@ async def send_next_question(context: CallbackContext, chat_id: int):
         return
     
     test = active_tests[chat_id]
-    question_num = test['current_question'] + 1
-    total_questions = len(test['questions'])
-    
-    # Create inline keyboard for answers
-    keyboard = [
-        [InlineKeyboardButton("A) " + question['option_a'], callback_data=f"answer_A_{chat_id}")],
-        [InlineKeyboardButton("B) " + question['option_b'], callback_data=f"answer_B_{chat_id}")],
-        [InlineKeyboardButton("C) " + question['option_c'], callback_data=f"answer_C_{chat_id}")],
-        [InlineKeyboardButton("D) " + question['option_d'], callback_data=f"answer_D_{chat_id}")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    message = f"📝 Savol {question_num}/{total_questions}\n\n"
-    message += f"❓ {question['question_text']}\n\n"
-    message += "⏱ Sizda 20 soniya vaqt bor!"
+    index = test['current_question']
     
+    # Question text and answer keyboard, prebuilt in start_test
     context.bot.send_message(
         chat_id=chat_id,
-        text=message,
-        reply_markup=reply_markup
+        text=test['texts'][index],
+        reply_markup=test['keyboards'][index]
     )
     
-    # Set timeout timer
-    def timeout_sync():
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                loop.create_task(timeout_handler(context, chat_id))
-            else:
-                asyncio.run(timeout_handler(context, chat_id))
-        except RuntimeError:
-            asyncio.run(timeout_handler(context, chat_id))
-    
-    timer = threading.Timer(20.0, timeout_sync)
-    timer.start()
-    question_timers[chat_id] = timer
+    # Set timeout job
+    question_timers[chat_id] = context.job_queue.run_once(question_timeout_job, 20.0, context=chat_id, job_kwargs=TEST_JOB_KWARGS)
+
+# Job queue callbacks (delays and timeouts run on the job queue's thread pool
+# instead of starting a new thread per timer; see TEST_JOB_KWARGS)
+
+def question_timeout_job(context: CallbackContext):
+    """Move on to the next question when the answer time runs out"""
+    asyncio.run(timeout_handler(context, context.job.context))
+
+def next_question_job(context: CallbackContext):
+    """Send the next question after a short pause"""
+    send_next_question_sync(context, context.job.context)
+
+def end_test_job(context: CallbackContext):
+    """Show test results after a short pause"""
+    end_test_sync(context, context.job.context)
 
 def end_test_sync(context: CallbackContext, chat_id: int):
     """End test and show results synchronously"""
@@ -834,42 +1237,33 @@ def end_test_sync(context: CallbackContext, chat_id: int):
     user = db.get_user(chat_id)
     user_name = f"{user['name']} {user['surname']}" if user else "Unknown"
     
+    max_score = results['total_questions'] * 4
+    
     # Send detailed results message to user
-    message = "🎉 Test yakunlandi!\n\n"
-    message += f"👤 Ism: {user_name}\n"
-    message += f"📚 Kitob: {results['book_name']}\n"
-    message += f"👥 Yosh guruhi: {results['age_group']}\n"
-    message += f"🎯 Ball: {results['score']}/{results['total_questions'] * 4}\n"
-    message += f"📊 Foiz: {results['percentage']:.1f}%\n"
-    message += f"✅ Javob berilgan savollar: {results['questions_answered']}/{results['total_questions']}\n"
-    message += f"⏱ Vaqt: {results['start_time'].strftime('%H:%M')} - {results['end_time'].strftime('%H:%M')}\n\n"
-    
-    if results['percentage'] >= 80:
-        message += "🏆 Ajoyib natija! Tabriklaymiz!"
-    elif results['percentage'] >= 60:
-        message += "👍 Yaxshi natija! Davom eting!"
-    else:
-        message += "📚 Qo'shimcha o'qish tavsiya etiladi."
+    verdict = next(text for threshold, text in TEST_RESULT_VERDICTS if results['percentage'] >= threshold)
+    message = TEST_RESULT_TEMPLATE.format(
+        user_name=user_name,
+        max_score=max_score,
+        start=datetime.datetime.fromisoformat(results['start_time']),
+        end=datetime.datetime.fromisoformat(results['end_time']),
+        verdict=verdict,
+        **results
+    )
     
-    context.bot.send_message(chat_id=chat_id, text=message)
+    # The results message carries the main menu keyboard, no separate "Asosiy menyu" message
+    context.bot.send_message(chat_id=chat_id, text=message, reply_markup=MAIN_MENU_KEYBOARD)
     
     # Send results to all admins
-    admin_message = f"📊 Yangi test natijasi:\n\n"
-    admin_message += f"👤 Foydalanuvchi: {user_name}\n"
-    admin_message += f"📱 Telefon: {user['phone'] if user else 'N/A'}\n"
-    admin_message += f"🌍 Manzil: {user['region']}, {user['district']} ({user['neighborhood']})\n" if user else ""
-    admin_message += f"📚 Kitob: {results['book_name']}\n"
-    admin_message += f"👥 Yosh: {results['age_group']}\n"
-    admin_message += f"🎯 Ball: {results['score']}/{results['total_questions'] * 4}\n"
-    admin_message += f"📊 Foiz: {results['percentage']:.1f}%\n"
-    admin_message += f"✅ Javoblar: {results['questions_answered']}/{results['total_questions']}\n"
-    admin_message += f"🕒 Vaqt: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    admin_message = TEST_RESULT_ADMIN_TEMPLATE.format(
+        user_name=user_name,
+        phone=user['phone'] if user else 'N/A',
+        address=f"🌍 Manzil: {user['region']}, {user['district']} ({user['neighborhood']})\n" if user else "",
+        max_score=max_score,
+        time=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        **results
+    )
     
-    for admin_id in ADMIN_IDS:
-        try:
-            context.bot.send_message(admin_id, admin_message)
-        except:
-            continue
+    notify_admins(admin_message)
     
     # Send celebration sticker
     try:
@@ -882,109 +1276,10 @@ def end_test_sync(context: CallbackContext, chat_id: int):
     
     # Cleanup test session
     test_manager.cleanup_test(chat_id)
-    
-    # Show main menu
-    show_main_menu_sync_direct(context, chat_id)
-
-def show_main_menu_sync_direct(context: CallbackContext, chat_id: int):
-    """Show main menu synchronously using context"""
-    keyboard = [
-        ["📝 Test topshirish", "📋 Loyiha haqida"],
-        ["💬 Fikr bildirish", "📊 Natijalarim"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-    
-    context.bot.send_message(
-        chat_id=chat_id,
-        text="Asosiy menyu:",
-        reply_markup=reply_markup
-    )
 
 async def end_test(context: CallbackContext, chat_id: int):
     """End test and show results"""
-    results = test_manager.get_test_results(chat_id)
-    
-    if not results:
-        context.bot.send_message(chat_id=chat_id, text="❌ Xatolik yuz berdi!")
-        return
-    
-    # Save results to database
-    db.save_test_result(
-        chat_id, results['age_group'], results['book_name'],
-        results['score'], results['total_questions'],
-        results['start_time'], results['end_time'],
-        results['questions_answered']
-    )
-    
-    # Get user info for detailed results
-    user = db.get_user(chat_id)
-    user_name = f"{user['name']} {user['surname']}" if user else "Unknown"
-    
-    # Send detailed results message to user
-    message = "🎉 Test yakunlandi!\n\n"
-    message += f"👤 Ism: {user_name}\n"
-    message += f"📚 Kitob: {results['book_name']}\n"
-    message += f"👥 Yosh guruhi: {results['age_group']}\n"
-    message += f"🎯 Ball: {results['score']}/{results['total_questions'] * 4}\n"
-    message += f"📊 Foiz: {results['percentage']:.1f}%\n"
-    message += f"✅ Javob berilgan savollar: {results['questions_answered']}/{results['total_questions']}\n"
-    message += f"⏱ Vaqt: {results['start_time'].strftime('%H:%M')} - {results['end_time'].strftime('%H:%M')}\n\n"
-    
-    if results['percentage'] >= 80:
-        message += "🏆 Ajoyib natija! Tabriklaymiz!"
-    elif results['percentage'] >= 60:
-        message += "👍 Yaxshi natija! Davom eting!"
-    else:
-        message += "📚 Qo'shimcha o'qish tavsiya etiladi."
-    
-    context.bot.send_message(chat_id=chat_id, text=message)
-    
-    # Send results to all admins
-    admin_message = f"📊 Yangi test natijasi:\n\n"
-    admin_message += f"👤 Foydalanuvchi: {user_name}\n"
-    admin_message += f"📱 Telefon: {user['phone'] if user else 'N/A'}\n"
-    admin_message += f"🌍 Manzil: {user['region']}, {user['district']} ({user['neighborhood']})\n" if user else ""
-    admin_message += f"📚 Kitob: {results['book_name']}\n"
-    admin_message += f"👥 Yosh: {results['age_group']}\n"
-    admin_message += f"🎯 Ball: {results['score']}/{results['total_questions'] * 4}\n"
-    admin_message += f"📊 Foiz: {results['percentage']:.1f}%\n"
-    admin_message += f"✅ Javoblar: {results['questions_answered']}/{results['total_questions']}\n"
-    admin_message += f"🕒 Vaqt: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-    
-    for admin_id in ADMIN_IDS:
-        try:
-            context.bot.send_message(admin_id, admin_message)
-        except:
-            continue
-    
-    # Send celebration sticker
-    try:
-        context.bot.send_sticker(
-            chat_id=chat_id,
-            sticker="CAACAgIAAxkBAAECOzFiZoFa5vVrMVTCRpK2_v-y6qWqOwAC2AADBREAAZxSCqpYnq6yW8EeBA"
-        )
-    except:
-        pass
-    
-    # Cleanup test session
-    test_manager.cleanup_test(chat_id)
-    
-    # Show main menu
-    await show_main_menu(context, chat_id)
-
-async def show_main_menu(context: CallbackContext, chat_id: int):
-    """Show main menu to user"""
-    keyboard = [
-        ["📝 Test topshirish", "📋 Loyiha haqida"],
-        ["💬 Fikr bildirish", "📊 Natijalarim"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-    
-    context.bot.send_message(
-        chat_id=chat_id,
-        text="Asosiy menyu:",
-        reply_markup=reply_markup
-    )
+    end_test_sync(context, chat_id)
 
 # Registration conversation handlers
 
@@ -995,13 +1290,13 @@ def start(update: Update, context: CallbackContext):
     # Check if user is already registered
     user = db.get_user(chat_id)
     if user:
-        update.message.reply_text(f"Assalomu alaykum, {user['name']}! Siz allaqachon ro'yxatdan o'tgansiz.")
+        update.message.reply_text(WELCOME_BACK_TEMPLATE.format(name=user['name']))
         show_main_menu_sync(update, context)
         return ConversationHandler.END
     
     # Check if user is admin
-    if chat_id in ADMIN_IDS:
-        update.message.reply_text("Assalomu alaykum, Admin! Admin paneliga xush kelibsiz.")
+    if chat_id in ADMIN_ID_SET:
+        update.message.reply_text(ADMIN_WELCOME_TEXT)
         show_admin_menu(update, context)
         return ConversationHandler.END
     
@@ -1014,11 +1309,7 @@ def start(update: Update, context: CallbackContext):
     except:
         pass
     
-    update.message.reply_text(
-        "🌟 Assalomu alaykum! Kitobxon Kids botiga xush kelibsiz!\n\n"
-        "📝 Ro'yxatdan o'tish uchun ma'lumotlaringizni kiriting.\n\n"
-        "👤 Ismingizni kiriting:"
-    )
+    update.message.reply_text(WELCOME_TEXT)
     
     return NAME
 
@@ -1032,7 +1323,7 @@ def name(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Iltimos, haqiqiy ismingizni kiriting (kamida 2 ta harf):")
         return NAME
     
-    if not re.match("^[a-zA-ZА-Яа-я\u0400-\u04FF ]+$", name_text):
+    if not NAME_RE.match(name_text):
         update.message.reply_text("❌ Ismda faqat harflar bo'lishi kerak:")
         return NAME
     
@@ -1050,7 +1341,7 @@ def surname(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Iltimos, haqiqiy familiyangizni kiriting (kamida 2 ta harf):")
         return SURNAME
     
-    if not re.match("^[a-zA-ZА-Яа-я\u0400-\u04FF ]+$", surname_text):
+    if not NAME_RE.match(surname_text):
         update.message.reply_text("❌ Familiyada faqat harflar bo'lishi kerak:")
         return SURNAME
     
@@ -1064,16 +1355,13 @@ def phone(update: Update, context: CallbackContext):
     phone_text = update.message.text.strip()
     
     # Validation - Uzbekistan phone format
-    if not re.match(r"^\+998\d{9}$", phone_text):
+    if not PHONE_RE.match(phone_text):
         update.message.reply_text("❌ Telefon raqamni to'g'ri formatda kiriting: +998901234567")
         return PHONE
     
     user_states[chat_id]["data"]["phone"] = phone_text
     
-    keyboard = [["7-10 yosh"], ["11-14 yosh"]]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    update.message.reply_text("🎂 Yosh guruhingizni tanlang:", reply_markup=reply_markup)
+    update.message.reply_text("🎂 Yosh guruhingizni tanlang:", reply_markup=AGE_KEYBOARD)
     return AGE
 
 def age(update: Update, context: CallbackContext):
@@ -1081,18 +1369,14 @@ def age(update: Update, context: CallbackContext):
     chat_id = update.message.chat_id
     age_text = update.message.text.strip()
     
-    if age_text not in ["7-10 yosh", "11-14 yosh"]:
-        keyboard = [["7-10 yosh"], ["11-14 yosh"]]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        update.message.reply_text("❌ Iltimos, ro'yxatdagi yosh guruhini tanlang:", reply_markup=reply_markup)
+    age_group = AGE_GROUP_BY_LABEL.get(age_text)
+    if age_group is None:
+        update.message.reply_text("❌ Iltimos, ro'yxatdagi yosh guruhini tanlang:", reply_markup=AGE_KEYBOARD)
         return AGE
     
-    user_states[chat_id]["data"]["age_group"] = age_text.replace(" yosh", "")
-    
-    keyboard = [[region] for region in LOCATIONS.keys()]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+    user_states[chat_id]["data"]["age_group"] = age_group
     
-    update.message.reply_text("🌍 Viloyatingizni tanlang:", reply_markup=reply_markup)
+    update.message.reply_text("🌍 Viloyatingizni tanlang:", reply_markup=REGION_KEYBOARD)
     return REGION
 
 def region(update: Update, context: CallbackContext):
@@ -1101,35 +1385,27 @@ def region(update: Update, context: CallbackContext):
     region_text = update.message.text.strip()
     
     if region_text not in LOCATIONS:
-        keyboard = [[region] for region in LOCATIONS.keys()]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        update.message.reply_text("❌ Iltimos, ro'yxatdagi viloyatni tanlang:", reply_markup=reply_markup)
+        update.message.reply_text("❌ Iltimos, ro'yxatdagi viloyatni tanlang:", reply_markup=REGION_KEYBOARD)
         return REGION
     
     user_states[chat_id]["data"]["region"] = region_text
     
-    districts = LOCATIONS[region_text]
-    keyboard = [[district] for district in districts]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    update.message.reply_text("🏘 Tumaningizni tanlang:", reply_markup=reply_markup)
+    update.message.reply_text("🏘 Tumaningizni tanlang:", reply_markup=DISTRICT_KEYBOARDS[region_text])
     return DISTRICT
 
 def district(update: Update, context: CallbackContext):
     """Handle district selection"""
     chat_id = update.message.chat_id
     district_text = update.message.text.strip()
-    region = user_states[chat_id]["data"]["region"]
+    user_data = user_states[chat_id]["data"]
+    region = user_data["region"]
     
-    if district_text not in LOCATIONS[region]:
-        districts = LOCATIONS[region]
-        keyboard = [[district] for district in districts]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        update.message.reply_text("❌ Iltimos, ro'yxatdagi tumanni tanlang:", reply_markup=reply_markup)
+    if district_text not in VALID_DISTRICTS[region]:
+        update.message.reply_text("❌ Iltimos, ro'yxatdagi tumanni tanlang:", reply_markup=DISTRICT_KEYBOARDS[region])
         return DISTRICT
     
-    user_states[chat_id]["data"]["district"] = district_text
-    update.message.reply_text("🏠 Mahallangizni yozing:", reply_markup=ReplyKeyboardRemove())
+    user_data["district"] = district_text
+    update.message.reply_text("🏠 Mahallangizni yozing:", reply_markup=REMOVE_KEYBOARD)
     return NEIGHBORHOOD
 
 def neighborhood(update: Update, context: CallbackContext):
@@ -1141,10 +1417,10 @@ def neighborhood(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Iltimos, mahalla nomini to'g'ri kiriting:")
         return NEIGHBORHOOD
     
-    user_states[chat_id]["data"]["neighborhood"] = neighborhood_text
+    user_data = user_states[chat_id]["data"]
+    user_data["neighborhood"] = neighborhood_text
     
     # Save user to database
-    user_data = user_states[chat_id]["data"]
     success = db.register_user(
         chat_id=chat_id,
         name=user_data["name"],
@@ -1166,29 +1442,18 @@ def neighborhood(update: Update, context: CallbackContext):
         except:
             pass
         
-        # Notify admins
-        admin_message = f"📋 Yangi foydalanuvchi ro'yxatdan o'tdi:\n\n"
-        admin_message += f"👤 Ism: {user_data['name']}\n"
-        admin_message += f"👨‍👩‍👧‍👦 Familiya: {user_data['surname']}\n"
-        admin_message += f"📱 Telefon: {user_data['phone']}\n"
-        admin_message += f"🎂 Yosh: {user_data['age_group']}\n"
-        admin_message += f"🌍 Viloyat: {user_data['region']}\n"
-        admin_message += f"🏘 Tuman: {user_data['district']}\n"
-        admin_message += f"🏠 Mahalla: {user_data['neighborhood']}\n"
-        admin_message += f"🕒 Vaqt: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        for admin_id in ADMIN_IDS:
-            try:
-                context.bot.send_message(admin_id, admin_message)
-            except:
-                continue
+        # Notify admins (rendered once, same text for every admin)
+        admin_message = REGISTRATION_ADMIN_TEMPLATE.format(
+            time=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            **user_data
+        )
+        notify_admins(admin_message)
         
         # Show main menu
         show_main_menu_sync(update, context)
         
         # Clean up state
-        if chat_id in user_states:
-            del user_states[chat_id]
+        user_states.pop(chat_id, None)
         
         return ConversationHandler.END
     else:
@@ -1197,13 +1462,7 @@ def neighborhood(update: Update, context: CallbackContext):
 
 def show_main_menu_sync(update: Update, context: CallbackContext):
     """Show main menu synchronously"""
-    keyboard = [
-        ["📝 Test topshirish", "📋 Loyiha haqida"],
-        ["💬 Fikr bildirish", "📊 Natijalarim"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
-    
-    update.message.reply_text("Asosiy menyu:", reply_markup=reply_markup)
+    update.message.reply_text("Asosiy menyu:", reply_markup=MAIN_MENU_KEYBOARD)
 
 # Main menu handlers
 
@@ -1218,17 +1477,13 @@ def handle_test_request(update: Update, context: CallbackContext):
         return
     
     # Check if user is admin (admins can choose books)
-    if chat_id in ADMIN_IDS:
+    if chat_id in ADMIN_ID_SET:
         # Show book selection for admins
         age_group = user['age_group']
-        books = AGE_GROUPS.get(age_group, [])
-        
-        keyboard = [[book] for book in books]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
         
         update.message.reply_text(
             f"👤 Admin: {age_group} yosh guruhi uchun kitoblardan birini tanlang:",
-            reply_markup=reply_markup
+            reply_markup=BOOK_KEYBOARDS.get(age_group)
         )
         
         user_states[chat_id] = {"selecting_book": True, "age_group": age_group}
@@ -1254,20 +1509,12 @@ def handle_test_request(update: Update, context: CallbackContext):
             pass
         
         update.message.reply_text(
-            f"🚀 Test avtomatik boshlandi!\n\n"
-            f"📚 Kitob: {random_book}\n"
-            f"👥 Yosh guruhi: {age_group}\n"
-            f"❓ Jami savollar: 25 ta\n"
-            f"⏱ Har bir savol uchun: 20 soniya\n"
-            f"🎯 Har bir to'g'ri javob: 4 ball\n\n"
-            f"🍀 Omad tilaymiz!",
-            reply_markup=ReplyKeyboardRemove()
+            TEST_START_TEMPLATE.format(heading="Test avtomatik boshlandi!", book_name=random_book, age_group=age_group),
+            reply_markup=REMOVE_KEYBOARD
         )
         
         # Send first question after a short delay
-        def delayed_question():
-            send_next_question_sync(context, chat_id)
-        threading.Timer(2.0, delayed_question).start()
+        context.job_queue.run_once(next_question_job, 2.0, context=chat_id, job_kwargs=TEST_JOB_KWARGS)
         
         # Clean up state
         if chat_id in user_states:
@@ -1286,11 +1533,8 @@ def handle_book_selection(update: Update, context: CallbackContext):
     
     age_group = user_states[chat_id]["age_group"]
     
-    if book_name not in AGE_GROUPS.get(age_group, []):
-        books = AGE_GROUPS.get(age_group, [])
-        keyboard = [[book] for book in books]
-        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-        update.message.reply_text("❌ Iltimos, ro'yxatdagi kitobni tanlang:", reply_markup=reply_markup)
+    if book_name not in AGE_GROUP_BOOKS.get(age_group, ()):
+        update.message.reply_text("❌ Iltimos, ro'yxatdagi kitobni tanlang:", reply_markup=BOOK_KEYBOARDS.get(age_group))
         return SELECT_BOOK
     
     # Start test
@@ -1302,20 +1546,12 @@ def handle_book_selection(update: Update, context: CallbackContext):
             pass
         
         update.message.reply_text(
-            f"🚀 Test boshlandi!\n\n"
-            f"📚 Kitob: {book_name}\n"
-            f"👥 Yosh guruhi: {age_group}\n"
-            f"❓ Jami savollar: 25 ta\n"
-            f"⏱ Har bir savol uchun: 20 soniya\n"
-            f"🎯 Har bir to'g'ri javob: 4 ball\n\n"
-            f"🍀 Omad tilaymiz!",
-            reply_markup=ReplyKeyboardRemove()
+            TEST_START_TEMPLATE.format(heading="Test boshlandi!", book_name=book_name, age_group=age_group),
+            reply_markup=REMOVE_KEYBOARD
         )
         
         # Send first question after a short delay
-        def delayed_question():
-            send_next_question_sync(context, chat_id)
-        threading.Timer(2.0, delayed_question).start()
+        context.job_queue.run_once(next_question_job, 2.0, context=chat_id, job_kwargs=TEST_JOB_KWARGS)
         
         # Clean up state
         if chat_id in user_states:
@@ -1340,23 +1576,7 @@ def send_next_question_sync(context: CallbackContext, chat_id: int):
 
 def handle_about(update: Update, context: CallbackContext):
     """Handle about project request"""
-    about_text = (
-        "📖 Kitobxon Kids loyihasi haqida\n\n"
-        "🎯 Maqsad: Bolalarning bilim darajasini baholash va o'qishga rag'batlantirishni ta'minlash\n\n"
-        "👥 Maqsadli auditoriya: 7-14 yosh oralig'idagi bolalar\n\n"
-        "📚 Test tizimi:\n"
-        "• 7-10 yosh guruhi uchun 4 ta kitob\n"
-        "• 11-14 yosh guruhi uchun 4 ta kitob\n"
-        "• Har bir kitobda 25 ta savol\n"
-        "• Har bir savol uchun 20 soniya vaqt\n"
-        "• To'g'ri javob uchun 4 ball\n\n"
-        "🏆 Natijalar:\n"
-        "• 80% va undan yuqori - A'lo\n"
-        "• 60-79% - Yaxshi\n"
-        "• 60% dan past - Qo'shimcha o'qish tavsiya etiladi\n\n"
-        "📞 Aloqa: @kitobxon_kids_support"
-    )
-    update.message.reply_text(about_text)
+    update.message.reply_text(ABOUT_TEXT)
 
 def handle_feedback_request(update: Update, context: CallbackContext):
     """Handle feedback request"""
@@ -1368,11 +1588,7 @@ def handle_feedback_request(update: Update, context: CallbackContext):
         update.message.reply_text("❌ Avval ro'yxatdan o'ting! /start ni bosing.")
         return ConversationHandler.END
     
-    update.message.reply_text(
-        "💭 Fikr-mulohazangizni yozing:\n\n"
-        "Bizga loyihamizni yaxshilashda yordam bering!",
-        reply_markup=ReplyKeyboardRemove()
-    )
+    update.message.reply_text(FEEDBACK_PROMPT_TEXT, reply_markup=REMOVE_KEYBOARD)
     return FEEDBACK
 
 def handle_feedback_text(update: Update, context: CallbackContext):
@@ -1395,12 +1611,7 @@ def handle_feedback_text(update: Update, context: CallbackContext):
         admin_message += f"📱 Telefon: {user['phone']}\n"
         admin_message += f"💬 Matn: {feedback_text}\n"
         admin_message += f"🕒 Vaqt: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        for admin_id in ADMIN_IDS:
-            try:
-                context.bot.send_message(admin_id, admin_message)
-            except:
-                continue
+        notify_admins(admin_message)
     else:
         update.message.reply_text("❌ Fikr-mulohaza saqlashda xatolik yuz berdi.")
     
@@ -1462,67 +1673,51 @@ def handle_answer(update: Update, context: CallbackContext):
     query.answer()
     
     # Parse callback data
-    try:
-        _, answer, chat_id_str = query.data.split('_')
-        chat_id = int(chat_id_str)
-    except:
+    match = ANSWER_CALLBACK_RE.match(query.data)
+    if match is None:
         return
+    answer = match.group(1)
+    chat_id = int(match.group(2))
     
     # Verify user
     if query.from_user.id != chat_id:
         return
     
     # Check if test is active
-    if chat_id not in active_tests:
+    test = active_tests.get(chat_id)
+    if test is None:
         query.edit_message_text("❌ Test sessiyasi tugagan.")
         return
     
-    # Cancel timeout timer
-    if chat_id in question_timers:
-        question_timers[chat_id].cancel()
-        del question_timers[chat_id]
+    # Cancel timeout job
+    test_manager.cancel_timeout(chat_id)
     
-    # Submit answer
+    # Submit answer and reuse its grading for the reply
     test_manager.submit_answer(chat_id, answer)
+    graded = test['answers'][-1]
     
-    # Show submitted answer
-    current_question = test_manager.get_current_question(chat_id)
-    if active_tests[chat_id]['current_question'] > 0:
-        prev_question_idx = active_tests[chat_id]['current_question'] - 1
-        prev_question = active_tests[chat_id]['questions'][prev_question_idx]
-        correct_answer = prev_question['correct_answer']
-        
-        if answer.upper() == correct_answer.upper():
-            query.edit_message_text(f"✅ To'g'ri javob! ({answer})\n\n+4 ball")
-        else:
-            query.edit_message_text(f"❌ Noto'g'ri javob. To'g'ri javob: {correct_answer}\n\nSizning javobingiz: {answer}")
+    if graded['is_correct']:
+        query.edit_message_text(f"✅ To'g'ri javob! ({answer})\n\n+4 ball")
+    else:
+        query.edit_message_text(f"❌ Noto'g'ri javob. To'g'ri javob: {graded['correct_answer']}\n\nSizning javobingiz: {answer}")
     
     # Check if test is complete
     if test_manager.is_test_complete(chat_id):
         # End test after 1 second delay
-        threading.Timer(1.0, lambda: end_test_sync(context, chat_id)).start()
+        context.job_queue.run_once(end_test_job, 1.0, context=chat_id, job_kwargs=TEST_JOB_KWARGS)
     else:
         # Send next question after 2 seconds automatically
-        def next_question_sync():
-            send_next_question_sync(context, chat_id)
-        threading.Timer(2.0, next_question_sync).start()
+        context.job_queue.run_once(next_question_job, 2.0, context=chat_id, job_kwargs=TEST_JOB_KWARGS)
 
 # Admin handlers
 
 def show_admin_menu(update: Update, context: CallbackContext):
     """Show admin menu"""
-    keyboard = [
-        ["👥 Foydalanuvchilar", "📊 Test natijalari"],
-        ["➕ Savol qo'shish", "📥 Eksport"],
-        ["📈 Statistika", "🔄 Yangilash"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    
-    update.message.reply_text("🔧 Admin paneli:", reply_markup=reply_markup)
+    update.message.reply_text("🔧 Admin paneli:", reply_markup=ADMIN_MENU_KEYBOARD)
 
 def handle_admin_users(update: Update, context: CallbackContext):
     """Handle admin users request"""
-    if update.message.chat_id not in ADMIN_IDS:
+    if update.message.chat_id not in ADMIN_ID_SET:
         return
     
     users = db.get_all_users()
@@ -1531,109 +1726,98 @@ def handle_admin_users(update: Update, context: CallbackContext):
         update.message.reply_text("👥 Hozircha foydalanuvchilar yo'q.")
         return
     
-    message = f"👥 Jami foydalanuvchilar: {len(users)}\n\n"
+    parts = [f"👥 Jami foydalanuvchilar: {len(users)}\n\n"]
     
     # Show last 10 users
     for user in users[:10]:
-        message += f"👤 {user['name']} {user['surname']}\n"
-        message += f"📱 {user['phone']}\n"
-        message += f"🎂 {user['age_group']} yosh\n"
-        message += f"🌍 {user['region']}, {user['district']}\n\n"
+        parts.append(
+            f"👤 {user['name']} {user['surname']}\n"
+            f"📱 {user['phone']}\n"
+            f"🎂 {user['age_group']} yosh\n"
+            f"🌍 {user['region']}, {user['district']}\n\n"
+        )
     
     if len(users) > 10:
-        message += f"📝 So'nggi 10 ta foydalanuvchi ko'rsatildi.\nJami: {len(users)} ta"
+        parts.append(f"📝 So'nggi 10 ta foydalanuvchi ko'rsatildi.\nJami: {len(users)} ta")
     
-    update.message.reply_text(message)
+    update.message.reply_text("".join(parts))
 
 def handle_admin_results(update: Update, context: CallbackContext):
     """Handle admin test results request"""
-    if update.message.chat_id not in ADMIN_IDS:
+    if update.message.chat_id not in ADMIN_ID_SET:
         return
     
-    results = db.get_test_results()
+    total_results = db.count_test_results()
     
-    if not results:
+    if not total_results:
         update.message.reply_text("📊 Hozircha test natijalari yo'q.")
         return
     
-    message = f"📊 Jami test natijalari: {len(results)}\n\n"
+    parts = [f"📊 Jami test natijalari: {total_results}\n\n"]
     
     # Show last 10 results
-    for result in results[:10]:
-        message += f"👤 {result['name']} {result['surname']}\n"
-        message += f"🎂 {result['age_group']} | 📚 {result['book_name']}\n"
-        message += f"🎯 {result['score']}/{result['total_questions'] * 4} ball ({result['percentage']:.1f}%)\n\n"
+    for result in db.get_test_results(limit=10):
+        parts.append(
+            f"👤 {result['name']} {result['surname']}\n"
+            f"🎂 {result['age_group']} | 📚 {result['book_name']}\n"
+            f"🎯 {result['score']}/{result['total_questions'] * 4} ball ({result['percentage']:.1f}%)\n\n"
+        )
     
-    if len(results) > 10:
-        message += f"📝 So'nggi 10 ta natija ko'rsatildi.\nJami: {len(results)} ta"
+    if total_results > 10:
+        parts.append(f"📝 So'nggi 10 ta natija ko'rsatildi.\nJami: {total_results} ta")
     
-    update.message.reply_text(message)
+    update.message.reply_text("".join(parts))
 
 def handle_admin_export(update: Update, context: CallbackContext):
     """Handle admin export request"""
-    if update.message.chat_id not in ADMIN_IDS:
+    if update.message.chat_id not in ADMIN_ID_SET:
         return
     
-    keyboard = [
-        ["📊 Excel - Foydalanuvchilar", "📊 Excel - Natijalar"],
-        ["📄 PDF - Foydalanuvchilar", "📄 PDF - Natijalar"],
-        ["🔙 Orqaga"]
-    ]
-    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
-    
-    update.message.reply_text("📥 Eksport turini tanlang:", reply_markup=reply_markup)
+    update.message.reply_text("📥 Eksport turini tanlang:", reply_markup=EXPORT_KEYBOARD)
+
+report_build_slots = threading.BoundedSemaphore(REPORT_BUILD_SLOTS)
+
+# Export buttons -> (data loader, report builder, report type, file name prefix, extension, caption)
+EXPORT_CHOICES = {
+    "📊 Excel - Foydalanuvchilar": (db.get_all_users, create_excel_report, "users", "foydalanuvchilar", "xlsx", "📊 Foydalanuvchilar ro'yxati (Excel)"),
+    "📊 Excel - Natijalar": (db.get_test_results, create_excel_report, "results", "test_natijalari", "xlsx", "📊 Test natijalari (Excel)"),
+    "📄 PDF - Foydalanuvchilar": (db.get_all_users, create_pdf_report, "users", "foydalanuvchilar", "pdf", "📄 Foydalanuvchilar ro'yxati (PDF)"),
+    "📄 PDF - Natijalar": (db.get_test_results, create_pdf_report, "results", "test_natijalari", "pdf", "📄 Test natijalari (PDF)"),
+    "📑 CSV - Foydalanuvchilar": (db.get_all_users, create_csv_report, "users", "foydalanuvchilar", "csv", "📑 Foydalanuvchilar ro'yxati (CSV)"),
+    "📑 CSV - Natijalar": (db.get_test_results, create_csv_report, "results", "test_natijalari", "csv", "📑 Test natijalari (CSV)")
+}
+
+# Excel exports above this many rows are sent as CSV instead;
+# PDF exports above PDF_MAX_TABLE_ROWS get a summary page plus the CSV
+EXCEL_MAX_ROWS = 50000
+PDF_MAX_TABLE_ROWS = 2000
+CSV_EXPORT_CHOICES = {"users": "📑 CSV - Foydalanuvchilar", "results": "📑 CSV - Natijalar"}
 
 def handle_export_choice(update: Update, context: CallbackContext):
     """Handle export format choice"""
-    if update.message.chat_id not in ADMIN_IDS:
+    if update.message.chat_id not in ADMIN_ID_SET:
         return
     
-    choice = update.message.text.strip()
-    
-    if choice == "🔙 Orqaga":
-        show_admin_menu(update, context)
-        return
+    load_data, build_report, report_type, prefix, extension, caption = EXPORT_CHOICES[update.message.text]
     
     update.message.reply_text("📊 Hisobot tayyorlanmoqda...")
     
     try:
-        if "Foydalanuvchilar" in choice:
-            data = db.get_all_users()
-            if "Excel" in choice:
-                buffer = create_excel_report(data, "users")
-                filename = f"foydalanuvchilar_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                update.message.reply_document(
-                    document=buffer,
-                    filename=filename,
-                    caption="📊 Foydalanuvchilar ro'yxati (Excel)"
-                )
-            else:  # PDF
-                buffer = create_pdf_report(data, "users")
-                filename = f"foydalanuvchilar_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                update.message.reply_document(
-                    document=buffer,
-                    filename=filename,
-                    caption="📄 Foydalanuvchilar ro'yxati (PDF)"
-                )
-        
-        elif "Natijalar" in choice:
-            data = db.get_test_results()
-            if "Excel" in choice:
-                buffer = create_excel_report(data, "results")
-                filename = f"test_natijalari_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                update.message.reply_document(
-                    document=buffer,
-                    filename=filename,
-                    caption="📊 Test natijalari (Excel)"
-                )
-            else:  # PDF
-                buffer = create_pdf_report(data, "results")
-                filename = f"test_natijalari_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                update.message.reply_document(
-                    document=buffer,
-                    filename=filename,
-                    caption="📄 Test natijalari (PDF)"
-                )
+        with report_build_slots:
+            data = load_data()
+            if extension == "xlsx" and len(data) > EXCEL_MAX_ROWS:
+                update.message.reply_text(f"ℹ️ {len(data)} ta qator Excel uchun juda ko'p, hisobot CSV formatida yuboriladi.")
+                _, build_report, report_type, prefix, extension, caption = EXPORT_CHOICES[CSV_EXPORT_CHOICES[report_type]]
+            buffer = build_report(data, report_type)
+            csv_buffer = None
+            if extension == "pdf" and len(data) > PDF_MAX_TABLE_ROWS:
+                csv_buffer = create_csv_report(data, report_type)
+        
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        update.message.reply_document(document=buffer, filename=f"{prefix}_{stamp}.{extension}", caption=caption)
+        if csv_buffer is not None:
+            csv_caption = EXPORT_CHOICES[CSV_EXPORT_CHOICES[report_type]][5]
+            update.message.reply_document(document=csv_buffer, filename=f"{prefix}_{stamp}.csv", caption=csv_caption)
         
         update.message.reply_text("✅ Hisobot muvaffaqiyatli yuborildi!")
         
@@ -1645,38 +1829,37 @@ def handle_export_choice(update: Update, context: CallbackContext):
 
 def handle_admin_stats(update: Update, context: CallbackContext):
     """Handle admin statistics request"""
-    if update.message.chat_id not in ADMIN_IDS:
+    if update.message.chat_id not in ADMIN_ID_SET:
         return
     
-    # Get statistics
-    total_users = len(db.get_all_users())
-    total_tests = len(db.get_test_results())
-    
-    # Age group stats
-    age_7_10 = len([u for u in db.get_all_users() if u['age_group'] == '7-10'])
-    age_11_14 = len([u for u in db.get_all_users() if u['age_group'] == '11-14'])
-    
-    # Average score
-    results = db.get_test_results()
-    if results:
-        avg_score = sum(r['percentage'] for r in results) / len(results)
-    else:
-        avg_score = 0
-    
-    # Today's registrations
-    today = datetime.datetime.now().strftime('%Y-%m-%d')
-    today_users = len([u for u in db.get_all_users() if today in str(u.get('registration_date', ''))])
-    
-    message = f"📈 Kitobxon Kids statistikasi\n\n"
-    message += f"👥 Jami foydalanuvchilar: {total_users}\n"
-    message += f"📊 Jami testlar: {total_tests}\n\n"
-    message += f"👶 7-10 yosh: {age_7_10} ta\n"
-    message += f"🧒 11-14 yosh: {age_11_14} ta\n\n"
-    message += f"📊 O'rtacha natija: {avg_score:.1f}%\n"
-    message += f"📅 Bugun ro'yxatdan o'tganlar: {today_users} ta\n\n"
-    message += f"🕒 So'nggi yangilanish: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    # Counts and averages are computed by SQLite
+    stats = db.get_statistics(datetime.datetime.now().strftime('%Y-%m-%d'))
+    
+    parts = [
+        "📈 Kitobxon Kids statistikasi\n\n",
+        f"👥 Jami foydalanuvchilar: {stats['total_users']}\n",
+        f"📊 Jami testlar: {stats['total_tests']}\n\n",
+        f"👶 7-10 yosh: {stats['age_7_10']} ta\n",
+        f"🧒 11-14 yosh: {stats['age_11_14']} ta\n\n",
+        f"📊 O'rtacha natija: {stats['avg_score']:.1f}%\n",
+        f"📅 Bugun ro'yxatdan o'tganlar: {stats['today_users']} ta\n\n",
+        f"🕒 So'nggi yangilanish: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    ]
     
-    update.message.reply_text(message)
+    update.message.reply_text("".join(parts))
+
+# Admin menu routing: one registered handler, exact-text lookup instead of a regex per button
+ADMIN_MENU_HANDLERS = {
+    "👥 Foydalanuvchilar": handle_admin_users,
+    "📊 Test natijalari": handle_admin_results,
+    "📥 Eksport": handle_admin_export,
+    "📈 Statistika": handle_admin_stats,
+    "🔄 Yangilash": show_admin_menu
+}
+
+def handle_admin_menu(update: Update, context: CallbackContext):
+    """Dispatch an admin menu button to its handler"""
+    ADMIN_MENU_HANDLERS[update.message.text](update, context)
 
 # Cancel and error handlers
 
@@ -1692,10 +1875,10 @@ def cancel(update: Update, context: CallbackContext):
     if chat_id in active_tests:
         test_manager.cleanup_test(chat_id)
     
-    update.message.reply_text("❌ Bekor qilindi.", reply_markup=ReplyKeyboardRemove())
+    update.message.reply_text("❌ Bekor qilindi.", reply_markup=REMOVE_KEYBOARD)
     
     # Show appropriate menu based on user role
-    if chat_id in ADMIN_IDS:
+    if chat_id in ADMIN_ID_SET:
         show_admin_menu(update, context)
     else:
         user = db.get_user(chat_id)
@@ -1724,7 +1907,13 @@ def main():
         return
     
     # Create updater
-    updater = Updater(token=BOT_TOKEN, use_context=True)
+    updater = Updater(
+        token=BOT_TOKEN,
+        use_context=True,
+        workers=UPDATER_WORKERS,
+        request_kwargs={'con_pool_size': CONNECTION_POOL_SIZE},
+        defaults=Defaults(disable_web_page_preview=True)  # no link previews on any message
+    )
     dispatcher = updater.dispatcher
     
     # Registration conversation
@@ -1774,17 +1963,12 @@ def main():
     dispatcher.add_handler(MessageHandler(Filters.regex('^📋 Loyiha haqida$'), handle_about))
     dispatcher.add_handler(MessageHandler(Filters.regex('^📊 Natijalarim$'), handle_my_results))
     
-    # Admin handlers
-    dispatcher.add_handler(MessageHandler(Filters.regex('^👥 Foydalanuvchilar$'), handle_admin_users))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^📊 Test natijalari$'), handle_admin_results))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^📥 Eksport$'), handle_admin_export))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^📈 Statistika$'), handle_admin_stats))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^🔄 Yangilash$'), show_admin_menu))
+    # Admin handlers (run on worker threads; the listing and statistics views query the database)
+    dispatcher.add_handler(MessageHandler(Filters.text(list(ADMIN_MENU_HANDLERS)), handle_admin_menu, run_async=True))
     
-    # Export handlers
-    dispatcher.add_handler(MessageHandler(Filters.regex('^📊 Excel'), handle_export_choice))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^📄 PDF'), handle_export_choice))
-    dispatcher.add_handler(MessageHandler(Filters.regex('^🔙 Orqaga$'), lambda u, c: show_admin_menu(u, c) if u.message.chat_id in ADMIN_IDS else None))
+    # Export handlers (run on a worker thread so report generation doesn't stall other updates)
+    dispatcher.add_handler(MessageHandler(Filters.text(list(EXPORT_CHOICES)), handle_export_choice, run_async=True))
+    dispatcher.add_handler(MessageHandler(Filters.regex('^🔙 Orqaga$'), lambda u, c: show_admin_menu(u, c) if u.message.chat_id in ADMIN_ID_SET else None))
     
     # Add callback query handler for test answers
     dispatcher.add_handler(CallbackQueryHandler(handle_answer, pattern='^answer_'))
@@ -1792,13 +1976,27 @@ def main():
     # Add error handler
     dispatcher.add_error_handler(error_handler)
     
+    # Start admin notification workers
+    for _ in range(ADMIN_NOTIFY_WORKERS):
+        threading.Thread(target=admin_notification_worker, args=(updater.bot,), daemon=True).start()
+    
     # Start bot
     logger.info("🚀 Kitobxon Kids Bot ishga tushdi!")
     print("🚀 Kitobxon Kids Bot ishga tushdi!")
     print(f"🔧 Admin IDs: {ADMIN_IDS}")
     print("📱 Bot token tekshirildi va ulanish amalga oshirildi.")
     
-    updater.start_polling()
+    if WEBHOOK_URL:
+        # Push-based delivery: no getUpdates requests while the bot is idle
+        updater.start_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=BOT_TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{BOT_TOKEN}"
+        )
+        logger.info(f"Webhook rejimi: {WEBHOOK_URL}")
+    else:
+        updater.start_polling()
     updater.idle()
 
 if __name__ == '__main__':